@@ -5,14 +5,20 @@ from pathlib import Path
 import pytest  # type: ignore
 
 from tinydb.middlewares import CachingMiddleware
-from tinydb.storages import MemoryStorage
+from tinydb.storages import MemoryStorage, NDJSONStorage
 from tinydb import TinyDB, JSONStorage
 
 
-@pytest.fixture(params=['memory', 'json'])
+@pytest.fixture(params=['memory', 'json', 'orjson', 'ndjson'])
 def db(request, tmp_path: Path):
     if request.param == 'json':
         db_ = TinyDB(tmp_path / 'test.db', storage=JSONStorage)
+    elif request.param == 'orjson':
+        pytest.importorskip('orjson')
+        db_ = TinyDB(tmp_path / 'test.db', storage=JSONStorage,
+                     use_orjson=True)
+    elif request.param == 'ndjson':
+        db_ = TinyDB(tmp_path / 'test.db', storage=NDJSONStorage)
     else:
         db_ = TinyDB(storage=MemoryStorage)
 
@@ -1,16 +1,27 @@
+import errno
 import json
 import os
 import random
+import sys
 import tempfile
+import time
 
 import pytest
 
-from tinydb import TinyDB, where
-from tinydb.storages import JSONStorage, MemoryStorage, Storage, touch
+from tinydb import TinyDB, where, storages
+from tinydb.storages import JSONStorage, MemoryStorage, NDJSONStorage, \
+    SharedMemoryStorage, Storage, touch, MMAP_THRESHOLD
 from tinydb.table import Document
 
 random.seed()
 
+# Run a test with and without orjson (if it's installed)
+use_orjson = pytest.mark.parametrize('use_orjson', [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(storages.orjson is None,
+                                                reason='orjson not installed'))
+])
+
 doc = {'none': [None, None], 'int': 42, 'float': 3.1415899999999999,
        'list': ['LITE', 'RES_ACID', 'SUS_DEXT'],
        'dict': {'hp': 13, 'sp': 5},
@@ -28,6 +39,582 @@ def test_json(tmpdir):
     storage.close()
 
 
+def test_json_large_locked(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    data = {'_default': {str(i): {'value': 'x' * 64, 'i': i}
+                         for i in range(2000)}}
+    storage = JSONStorage(path)
+    storage.write(data)
+    other = JSONStorage(path, access_mode='r')
+
+    mapped = []
+    map_file = storages._map_file
+    monkeypatch.setattr(storages, '_map_file',
+                        lambda *args: mapped.append(args) or map_file(*args))
+
+    # The file is only mapped while no one else may truncate it
+    with storage.transaction():
+        assert other.read() == data
+        assert not mapped
+
+        assert storage.read() == data
+        assert len(mapped) == 1
+
+    assert other.read() == data
+    assert len(mapped) == 2
+
+    storage.close()
+    other.close()
+
+
+def test_json_write_locked(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+
+    acquired = []
+    acquire = storages._FileLock.acquire
+    monkeypatch.setattr(storages._FileLock, 'acquire',
+                        lambda self, *args, **kwargs:
+                        acquired.append(kwargs) or
+                        acquire(self, *args, **kwargs))
+
+    # Every write takes the lock, unless it's held for a transaction already
+    storage.write({'_default': {'1': {'a': 'x' * 100}}})
+    storage.write({'_default': {}})
+    assert acquired == [{}, {}]
+
+    with storage.transaction():
+        storage.write({'_default': {'1': {'a': 1}}})
+    assert acquired == [{}, {}, {}]
+
+    storage.close()
+
+
+def test_json_write_locked_same_thread(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    other = JSONStorage(path)
+    storage.write(doc)
+
+    # Waiting for the transaction of another instance would never end
+    storage.begin()
+    with pytest.raises(RuntimeError):
+        other.write({'_default': {}})
+    storage.rollback()
+
+    other.write({'_default': {}})
+    assert storage.read() == {'_default': {}}
+
+    storage.close()
+    other.close()
+
+
+def test_json_read_only_no_lock_file(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    JSONStorage(path).close()
+
+    storage = JSONStorage(path, access_mode='r')
+    with pytest.raises(IOError):
+        storage.write(doc)
+    assert not os.path.exists(path + '.lock')
+    storage.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_json_write_waits_for_transaction(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    storage.write(doc)
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if not pid:  # pragma: no cover
+        status = 1
+        try:
+            with storage.transaction():
+                os.write(write_fd, b'x')
+                time.sleep(0.2)
+                storage.write({'_default': {'1': {'child': 1}}})
+            status = 0
+        finally:
+            os._exit(status)
+
+    # Wait until the child process is in its transaction
+    os.read(read_fd, 1)
+    storage.write({'_default': {'1': {'parent': 1}}})
+
+    _, status = os.waitpid(pid, 0)
+    assert status == 0
+    assert storage.read() == {'_default': {'1': {'parent': 1}}}
+
+    os.close(read_fd)
+    os.close(write_fd)
+    storage.close()
+
+
+def test_json_empty(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    other = JSONStorage(path)
+
+    def pread(fd, size, offset):
+        raise AssertionError('Empty files must not be read')
+
+    # Empty files are detected from their size alone
+    with monkeypatch.context() as m:
+        m.setattr(os, 'pread', pread)
+        assert storage.read() is None
+
+    # ... which isn't cached, the file may be written by someone else
+    other.write(doc)
+    assert storage.read() == doc
+
+    storage.close()
+    other.close()
+
+
+def test_json_large(tmpdir):
+    # Large enough to be read using a memory map
+    path = str(tmpdir.join('test.db'))
+    data = {'_default': {str(i): {'value': 'x' * 64, 'i': i}
+                         for i in range(2000)}}
+    storage = JSONStorage(path)
+    storage.write(data)
+    assert os.path.getsize(path) >= MMAP_THRESHOLD
+
+    assert storage.read() == data
+    storage.close()
+
+    storage = JSONStorage(path, access_mode='r')
+    assert storage.read() == data
+    storage.close()
+
+    # Large enough to use huge pages
+    data = {'_default': {str(i): {'value': 'x' * 1024} for i in range(2048)}}
+    storage = JSONStorage(path)
+    storage.write(data)
+    assert storage.read() == data
+    storage.close()
+
+
+def test_json_transaction_sync(tmpdir, monkeypatch):
+    synced = []
+    sync = storages._sync
+
+    def counting_sync(fd):
+        synced.append(fd)
+        sync(fd)
+
+    monkeypatch.setattr(storages, '_sync', counting_sync)
+
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+
+    storage.write(doc)
+    assert len(synced) == 1
+
+    # Writes inside a transaction are synced once on commit. Only the first
+    # write, which replaces the database file, is synced right away.
+    with storage.transaction():
+        for i in range(5):
+            storage.write({'_default': {str(i): {'i': i}}})
+            assert storage.read() == {'_default': {str(i): {'i': i}}}
+        assert len(synced) == 2
+
+    assert len(synced) == 3
+    assert storage.read() == {'_default': {'4': {'i': 4}}}
+
+    # Transactions without writes don't sync at all
+    with storage.transaction():
+        storage.read()
+
+    assert len(synced) == 3
+    storage.close()
+
+
+@pytest.mark.parametrize('hardlinks', [True, False])
+def test_json_transaction_backup(tmpdir, monkeypatch, hardlinks):
+    if not hardlinks:
+        def link(source, target):
+            raise OSError('Hardlinks not supported')
+
+        monkeypatch.setattr(os, 'link', link)
+
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    storage.write(doc)
+
+    storage.begin()
+    backup_path = path + '.backup'
+    assert os.path.exists(backup_path)
+
+    # Writing must not change the backup, even if it's a hardlink
+    storage.write({'_default': {}})
+    assert storage.read() == {'_default': {}}
+    with open(backup_path) as backup:
+        assert json.load(backup) == doc
+
+    storage.write({'_default': {'1': {'a': 1}}})
+    storage.rollback()
+
+    assert not os.path.exists(backup_path)
+    assert storage.read() == doc
+
+    # Rolling back a transaction without writes
+    storage.begin()
+    storage.rollback()
+
+    assert not os.path.exists(backup_path)
+    assert storage.read() == doc
+
+    storage.begin()
+    storage.write({'_default': {}})
+    storage.commit()
+
+    assert not os.path.exists(backup_path)
+    assert storage.read() == {'_default': {}}
+    storage.close()
+
+
+def test_json_transaction_symlink(tmpdir):
+    target = str(tmpdir.join('target.db'))
+    path = str(tmpdir.join('test.db'))
+    os.symlink(target, path)
+
+    storage = JSONStorage(path)
+    storage.write(doc)
+
+    # Writes go through the symlink
+    with storage.transaction():
+        storage.write({'_default': {}})
+
+    assert os.path.islink(path)
+    with open(target) as f:
+        assert json.load(f) == {'_default': {}}
+
+    with pytest.raises(ValueError):
+        with storage.transaction():
+            storage.write({'_default': {'1': {'a': 1}}})
+            raise ValueError()
+
+    assert os.path.islink(path)
+    with open(target) as f:
+        assert json.load(f) == {'_default': {}}
+
+    storage.close()
+
+
+def test_json_transaction_hardlink(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    other_path = str(tmpdir.join('other.db'))
+    storage = JSONStorage(path)
+    storage.write(doc)
+    os.link(path, other_path)
+
+    # Other hardlinks to the database file see the changes
+    with storage.transaction():
+        storage.write({'_default': {}})
+
+    assert os.path.samefile(path, other_path)
+    with open(other_path) as f:
+        assert json.load(f) == {'_default': {}}
+
+    storage.close()
+
+
+def test_json_transaction_replace(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    storage.write(doc)
+    os.chmod(path, 0o640)
+
+    # The database file is only replaced once the new contents are written
+    replace = os.replace
+
+    def checked_replace(source, target):
+        if source == path + '.new':
+            with open(source) as f:
+                assert json.load(f) == {'_default': {}}
+        replace(source, target)
+
+    monkeypatch.setattr(os, 'replace', checked_replace)
+
+    with storage.transaction():
+        storage.write({'_default': {}})
+
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    storage.close()
+
+
+def test_json_transaction_other_instance(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    other = JSONStorage(path)
+    storage.write(doc)
+
+    # Changes made in a transaction are visible to other instances (or
+    # processes) that have the file open already
+    with other.transaction():
+        other.write({'_default': {}})
+
+    assert storage.read() == {'_default': {}}
+
+    storage.write(doc)
+    assert other.read() == doc
+
+    with other.transaction():
+        other.write({'_default': {}})
+
+    # Writing the data written last time must not be skipped
+    storage.write(doc)
+    assert other.read() == doc
+
+    storage.close()
+    other.close()
+
+
+def test_json_lock_file_per_process(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+
+    with storage.transaction():
+        lock_fd = storage._lock._fd
+
+    # The lock file is opened once per process
+    with storage.transaction():
+        assert storage._lock._fd == lock_fd
+
+    # A forked child process has to use its own lock file handle
+    pid = os.getpid()
+    monkeypatch.setattr(os, 'getpid', lambda: pid + 1)
+    with storage.transaction():
+        assert storage._lock._pid == pid + 1
+
+    storage.close()
+    assert storage._lock._fd is None
+
+
+def test_json_lock_file_symlink(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    target = tmpdir.join('target')
+    target.write('important')
+    os.symlink(str(target), path + '.lock')
+
+    storage = JSONStorage(path)
+
+    # The lock file is never followed (or truncated)
+    with pytest.raises(OSError):
+        storage.begin()
+    assert target.read() == 'important'
+
+    storage.close()
+
+
+def test_json_unchanged_write(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    storage.write(doc)
+
+    synced = []
+    monkeypatch.setattr(storages, '_sync', synced.append)
+
+    # Writing the same data again doesn't touch the file
+    storage.write(doc)
+    assert synced == []
+
+    # ... unless it has been modified in the meantime
+    with open(path, 'w') as f:
+        f.write('{}')
+
+    storage.write(doc)
+    assert len(synced) == 1
+    assert storage.read() == doc
+    storage.close()
+
+
+def test_json_no_space_left(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    storage.write({'_default': {}})
+
+    def posix_fallocate(fd, offset, length):
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+    monkeypatch.setattr(os, 'posix_fallocate', posix_fallocate, raising=False)
+
+    # Growing the file fails before it has been modified
+    with pytest.raises(OSError):
+        storage.write(doc)
+
+    assert storage.read() == {'_default': {}}
+    storage.close()
+
+
+def test_ndjson(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = NDJSONStorage(path)
+    assert storage.read() is None
+
+    storage.write({'_default': {'1': doc}, 'empty': {}})
+    assert storage.read() == {'_default': {'1': doc}, 'empty': {}}
+    size = os.path.getsize(path)
+
+    # Changes are appended to the log
+    storage.write({'_default': {'1': doc, '2': {'a': 1}}, 'empty': {}})
+    assert os.path.getsize(path) > size
+    with open(path) as f:
+        assert json.loads(f.read().splitlines()[-1]) == {
+            'op': 'upsert', 'table': '_default', 'id': '2', 'doc': {'a': 1}
+        }
+
+    storage.write({'_default': {'2': {'a': 2}}, 'new': {}})
+    storage.close()
+
+    # Replaying the log from a new instance
+    storage = NDJSONStorage(path)
+    assert storage.read() == {'_default': {'2': {'a': 2}}, 'new': {}}
+    storage.close()
+
+
+def test_ndjson_unchanged_write(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = NDJSONStorage(path)
+    storage.write({'_default': {'1': doc}})
+    size = os.path.getsize(path)
+
+    storage.write({'_default': {'1': dict(doc)}})
+    assert os.path.getsize(path) == size
+    storage.close()
+
+
+def test_ndjson_compaction(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = NDJSONStorage(path)
+
+    entries = []
+    for i in range(20):
+        storage.write({'_default': {'1': {'i': i}}})
+        assert storage.read() == {'_default': {'1': {'i': i}}}
+
+        with open(path) as f:
+            entries.append(len(f.read().splitlines()))
+
+    # One entry for the table and one for the document, plus updates until
+    # the log is compacted
+    assert entries[:6] == [2, 3, 4, 2, 3, 4]
+    assert max(entries) == 4
+    storage.close()
+
+
+def test_ndjson_modified_by_other_instance(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = NDJSONStorage(path)
+    other = NDJSONStorage(path)
+
+    storage.write({'_default': {'1': {'a': 1}}})
+    other.write({'_default': {'2': {'b': 2}}})
+
+    # The file has changed since the last write, so it's written from scratch
+    storage.write({'_default': {'1': {'a': 1}, '3': {'c': 3}}})
+    assert other.read() == {'_default': {'1': {'a': 1}, '3': {'c': 3}}}
+
+    # After reading, changes are relative to the file's contents
+    other.write({'_default': {'1': {'a': 1}}})
+    assert storage.read() == {'_default': {'1': {'a': 1}}}
+
+    storage.close()
+    other.close()
+
+
+def test_ndjson_incomplete_entry(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = NDJSONStorage(path)
+    storage.write({'_default': {'1': {'a': 1}}})
+    storage.close()
+
+    # A write has been interrupted after appending part of an entry
+    with open(path, 'ab') as f:
+        f.write(b'\n  \n{"op": "upsert", "table": "_default", "id": "2", "d')
+
+    storage = NDJSONStorage(path)
+    assert storage.read() == {'_default': {'1': {'a': 1}}}
+
+    # The next write removes the incomplete entry
+    storage.write({'_default': {'1': {'a': 1}, '3': {'c': 3}}})
+    with open(path, 'rb') as f:
+        content = f.read()
+    assert content.endswith(b'\n')
+    assert b'"id": "2"' not in content
+    storage.close()
+
+    storage = NDJSONStorage(path)
+    assert storage.read() == {'_default': {'1': {'a': 1}, '3': {'c': 3}}}
+    storage.close()
+
+
+def test_ndjson_large(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    data = {'_default': {str(i): {'value': 'x' * 64, 'i': i}
+                         for i in range(2000)}}
+    storage = NDJSONStorage(path)
+    storage.write(data)
+    storage.close()
+    assert os.path.getsize(path) >= MMAP_THRESHOLD
+
+    mapped = []
+    map_file = storages._map_file
+    monkeypatch.setattr(storages, '_map_file',
+                        lambda *args: mapped.append(args) or map_file(*args))
+
+    # The log is replayed straight from the memory map
+    storage = NDJSONStorage(path)
+    assert storage.read() == data
+    assert len(mapped) == 1
+    storage.close()
+
+
+def test_ndjson_transaction(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = NDJSONStorage(path)
+    storage.write({'_default': {'1': {'a': 1}}})
+
+    storage.begin()
+    storage.write({'_default': {'1': {'a': 2}}})
+    storage.write({'_default': {'1': {'a': 3}}})
+    storage.rollback()
+
+    assert storage.read() == {'_default': {'1': {'a': 1}}}
+
+    storage.write({'_default': {'1': {'a': 1}, '2': {'b': 2}}})
+    assert storage.read() == {'_default': {'1': {'a': 1}, '2': {'b': 2}}}
+    storage.close()
+
+
+def test_ndjson_short_writes(tmpdir, monkeypatch):
+    pwritev = os.pwritev
+
+    def short_pwritev(fd, buffers, offset):
+        # Write at most 7 bytes at once
+        return pwritev(fd, [bytes(b''.join(buffers)[:7])], offset)
+
+    monkeypatch.setattr(os, 'pwritev', short_pwritev)
+
+    path = str(tmpdir.join('test.db'))
+    storage = NDJSONStorage(path)
+    storage.write({'_default': {'1': doc}})
+    storage.write({'_default': {'1': doc, '2': {'a': 1}}})
+    storage.close()
+
+    storage = NDJSONStorage(path)
+    assert storage.read() == {'_default': {'1': doc, '2': {'a': 1}}}
+    storage.close()
+
+
+def test_ndjson_indent(tmpdir):
+    with pytest.raises(ValueError):
+        NDJSONStorage(str(tmpdir.join('test.db')), indent=2)
+
+
 def test_json_kwargs(tmpdir):
     db_file = tmpdir.join('test.db')
     db = TinyDB(str(db_file), sort_keys=True, indent=4, separators=(',', ': '))
@@ -49,6 +636,71 @@ def test_json_kwargs(tmpdir):
     db.close()
 
 
+def test_json_sort_keys(tmpdir):
+    db_file = tmpdir.join('test.db')
+    db = TinyDB(str(db_file), sort_keys=True)
+
+    db.insert({'b': 1, 'a': 2})
+
+    assert json.loads(db_file.read()) == {'_default': {'1': {'b': 1, 'a': 2}}}
+    assert db_file.read().index('"a"') < db_file.read().index('"b"')
+    db.close()
+
+
+@use_orjson
+def test_json_options(tmpdir, use_orjson):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path, use_orjson=use_orjson, sort_keys=True,
+                          indent=2)
+    storage.write({'_default': {'1': {'b': 1, 'a': 2}}})
+
+    with open(path) as f:
+        assert f.read() == json.dumps({'_default': {'1': {'b': 1, 'a': 2}}},
+                                      sort_keys=True, indent=2)
+    storage.close()
+
+
+@use_orjson
+def test_json_non_finite(tmpdir, use_orjson):
+    path = str(tmpdir.join('test.db'))
+    tmpdir.join('test.db').write(
+        '{"_default": {"1": {"nan": NaN, "inf": Infinity}}}'
+    )
+
+    storage = JSONStorage(path, use_orjson=use_orjson)
+    data = storage.read()
+    assert data['_default']['1']['nan'] != data['_default']['1']['nan']
+    assert data['_default']['1']['inf'] == float('inf')
+    storage.close()
+
+
+def test_json_non_finite_write(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    storage.write({'_default': {'1': {'inf': float('-inf')}}})
+
+    assert storage.read() == {'_default': {'1': {'inf': float('-inf')}}}
+    storage.close()
+
+
+@use_orjson
+def test_json_big_int(tmpdir, use_orjson):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path, use_orjson=use_orjson)
+    storage.write({'_default': {'1': {'int': 2 ** 64, 'neg': -2 ** 100}}})
+
+    assert storage.read() == {'_default': {'1': {'int': 2 ** 64,
+                                                 'neg': -2 ** 100}}}
+    storage.close()
+
+
+def test_json_orjson_missing(tmpdir, monkeypatch):
+    monkeypatch.setattr(storages, 'orjson', None)
+
+    with pytest.raises(ImportError):
+        JSONStorage(str(tmpdir.join('test.db')), use_orjson=True)
+
+
 def test_json_readwrite(tmpdir):
     """
     Regression test for issue #1
@@ -141,11 +793,224 @@ def test_in_memory():
     assert other.read() != storage.read()
 
 
+def test_in_memory_rollback():
+    storage = MemoryStorage()
+    storage.write({'_default': {1: {'int': 1, 'set': {1, 2}}}})
+
+    storage.begin()
+    storage.read()['_default'][1]['int'] = 2
+    storage.read()['_default'][2] = {}
+    storage.rollback()
+
+    # The backup keeps non-JSON types and keys
+    assert storage.read() == {'_default': {1: {'int': 1, 'set': {1, 2}}}}
+
+
+def test_in_memory_rollback_tables():
+    storage = MemoryStorage()
+    untouched = {'1': {'int': 1}}
+    storage.write({'a': {'1': {'int': 1}}, 'b': untouched})
+
+    # Tables are only backed up when they are accessed
+    storage.begin()
+    storage.read()['a']['1']['int'] = 2
+    storage.write({'c': {}})
+    storage.read()['c']['1'] = {'int': 3}
+    storage.rollback()
+
+    assert storage.read() == {'a': {'1': {'int': 1}}, 'b': {'1': {'int': 1}}}
+    assert storage.read()['b'] is untouched
+
+    storage.begin()
+    for table in storage.read().values():
+        table['1']['int'] = 4
+    del storage.read()['a']
+    storage.rollback()
+
+    assert storage.read() == {'a': {'1': {'int': 1}}, 'b': {'1': {'int': 1}}}
+
+    # Copies of the tables hand out the tables, too
+    copies = [dict, lambda tables: {**tables},
+              lambda tables: dict.copy(tables)]
+    if sys.version_info >= (3, 9):
+        copies.append(lambda tables: tables | {})
+
+    for copy_tables in copies:
+        storage.begin()
+        tables = copy_tables(storage.read())
+        tables['a']['1']['int'] = 99
+        storage.write(tables)
+        storage.rollback()
+
+        assert storage.read() == {'a': {'1': {'int': 1}},
+                                  'b': {'1': {'int': 1}}}
+
+    storage.begin()
+    storage.read()['a']['1']['int'] = 5
+    storage.commit()
+
+    assert storage.read() == {'a': {'1': {'int': 5}}, 'b': {'1': {'int': 1}}}
+    assert type(storage.read()) is dict
+
+
 def test_in_memory_close():
     with TinyDB(storage=MemoryStorage) as db:
         db.insert({})
 
 
+@pytest.fixture
+def shm_name():
+    name = f'tinydb_test_{os.getpid()}_{random.getrandbits(32)}'
+    yield name
+
+    storage = SharedMemoryStorage(name)
+    storage.unlink()
+    storage.close()
+
+
+def test_shared_memory(shm_name):
+    storage = SharedMemoryStorage(shm_name)
+    assert storage.read() is None
+
+    storage.write(doc)
+    assert storage.read() == doc
+
+    # Other instances (and processes) see the same data
+    other = SharedMemoryStorage(shm_name)
+    assert other.read() == doc
+
+    other.write({'_default': {1: {'set': {1, 2}}}})
+    assert storage.read() == {'_default': {1: {'set': {1, 2}}}}
+
+    # Reading again doesn't unpickle the unchanged data
+    assert storage.read() is storage.read()
+
+    storage.close()
+    other.close()
+
+
+def test_shared_memory_transaction(shm_name):
+    storage = SharedMemoryStorage(shm_name)
+    other = SharedMemoryStorage(shm_name)
+    storage.write({'_default': {'1': {'a': 1}}})
+
+    with pytest.raises(ValueError):
+        with storage.transaction():
+            storage.read()['_default']['1']['a'] = 2
+            storage.write({'_default': {}})
+            assert other.read() == {'_default': {}}
+            raise ValueError()
+
+    assert storage.read() == {'_default': {'1': {'a': 1}}}
+    assert other.read() == {'_default': {'1': {'a': 1}}}
+
+    with storage.transaction():
+        storage.write({'_default': {'2': {'b': 2}}})
+
+    assert other.read() == {'_default': {'2': {'b': 2}}}
+
+    storage.close()
+    other.close()
+
+
+def test_shared_memory_tinydb(shm_name):
+    db = TinyDB(shm_name, storage=SharedMemoryStorage)
+    db.insert_multiple({'int': 1, 'char': c} for c in 'abc')
+    assert db.count(where('int') == 1) == 3
+    db.close()
+
+    db = TinyDB(shm_name, storage=SharedMemoryStorage)
+    db.update({'int': 2}, where('char') == 'a')
+    assert db.count(where('int') == 1) == 2
+    db.close()
+
+
+def test_shared_memory_stale_block(shm_name):
+    storage = SharedMemoryStorage(shm_name)
+    storage.write(doc)
+
+    # A writer died after creating the next block but before publishing it
+    stale = storages._shared_memory(f'{shm_name}@2', create=True, size=1)
+    stale.close()
+
+    storage.write({'_default': {}})
+    other = SharedMemoryStorage(shm_name)
+    assert other.read() == {'_default': {}}
+
+    storage.close()
+    other.close()
+
+
+def test_shared_memory_corrupted(shm_name):
+    storage = SharedMemoryStorage(shm_name)
+    storage.write(doc)
+
+    block = storages._shared_memory(f'{shm_name}@1')
+    block.buf[SharedMemoryStorage.DATA_HEADER.size] ^= 0xff
+    block.close()
+
+    other = SharedMemoryStorage(shm_name)
+    with pytest.raises(ValueError):
+        other.read()
+
+    storage.close()
+    other.close()
+
+
+def test_shared_memory_similar_names(shm_name):
+    storage = SharedMemoryStorage(shm_name)
+    storage.write(doc)
+
+    # The header of this database must not be a data block of the other one
+    other = SharedMemoryStorage(f'{shm_name}_1')
+    assert other.read() is None
+
+    other.write({'_default': {}})
+    storage.write({'_default': {'1': {'a': 1}}})
+    assert other.read() == {'_default': {}}
+    assert storage.read() == {'_default': {'1': {'a': 1}}}
+
+    other.unlink()
+    other.close()
+    storage.close()
+
+
+def test_shared_memory_invalid_name():
+    for name in ('', 'a/b', '../x', 'a@1'):
+        with pytest.raises(ValueError):
+            SharedMemoryStorage(name)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_shared_memory_processes(shm_name):
+    storage = SharedMemoryStorage(shm_name)
+    storage.write({'counter': {'1': {'value': 0}}})
+
+    # Forked children share the storage instance with the parent
+    children = []
+    for _ in range(4):
+        pid = os.fork()
+        if not pid:  # pragma: no cover
+            status = 1
+            try:
+                for _ in range(50):
+                    with storage.transaction():
+                        data = storage.read()
+                        data['counter']['1']['value'] += 1
+                        storage.write(data)
+                status = 0
+            finally:
+                os._exit(status)
+        children.append(pid)
+
+    for pid in children:
+        _, status = os.waitpid(pid, 0)
+        assert status == 0
+
+    assert storage.read() == {'counter': {'1': {'value': 200}}}
+    storage.close()
+
+
 def test_custom():
     # noinspection PyAbstractClass
     class MyStorage(Storage):
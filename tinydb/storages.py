@@ -3,16 +3,57 @@ Contains the :class:`base class <tinydb.storages.Storage>` for storages and
 implementations.
 """
 
+import codecs
+import copy
+import errno
 from contextlib import contextmanager
 import fcntl
-import io
+import hashlib
 import json
+import mmap
 import os
+import pickle
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
 import warnings
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from stat import S_ISREG
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple, \
+    TypeVar
 
-__all__ = ('Storage', 'JSONStorage', 'MemoryStorage')
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+__all__ = ('Storage', 'JSONStorage', 'NDJSONStorage', 'MemoryStorage',
+           'SharedMemoryStorage')
+
+# ioctl request to reflink a file, see ioctl_ficlone(2)
+FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+
+T = TypeVar('T')
+
+# Maximum number of buffers per vectored write
+try:
+    IOV_MAX = max(os.sysconf('SC_IOV_MAX'), 1)
+except (AttributeError, ValueError, OSError):  # pragma: no cover
+    IOV_MAX = 16
+
+#: Files of at least this size (in bytes) are read using a memory map
+MMAP_THRESHOLD = 64 * 1024
+
+# Size of a huge page on most platforms
+HUGE_PAGE_SIZE = 2 * 1024 * 1024
+
+# A complete (newline terminated) and non-blank line of an NDJSON file
+NDJSON_LINE = re.compile(rb'[^\n]*\S[^\n]*\n')
 
 
 def touch(path: str, create_dirs: bool):
@@ -31,16 +72,304 @@ def touch(path: str, create_dirs: bool):
 
     # Create the file by opening it in 'a' mode which creates the file if it
     # does not exist yet but does not modify its contents
-    with open(path, 'a'):
+    with open(path, 'ab'):
         pass
 
 
+def _clone_file(source: str, target: str, link=True) -> bool:
+    """
+    Create a copy of a file as cheaply as possible.
+
+    Tries to create a hardlink first (if allowed), then a reflink (Linux
+    only) and falls back to copying the file contents.
+
+    :param source: The file to copy.
+    :param target: Where to put the copy.
+    :param link: Whether the copy may be a hardlink.
+    :return: Whether the copy is a hardlink, i.e. shares its data with the
+             source file.
+    """
+    if link:
+        try:
+            os.link(source, target)
+            return True
+        except OSError:
+            pass
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            if not sys.platform.startswith('linux'):
+                raise OSError('Reflinks are only supported on Linux')
+
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            shutil.copyfileobj(src, dst)
+
+    # The copy may replace the source file on rollback
+    shutil.copymode(source, target)
+
+    return False
+
+
+def _is_replaceable(path: str) -> bool:
+    """
+    Check whether a file can be replaced by a new file without anyone
+    noticing.
+
+    That's the case for regular files (not symlinks) without other hardlinks
+    that we own and that don't have extended attributes (like ACLs).
+    """
+    stat = os.lstat(path)
+    if not S_ISREG(stat.st_mode) or stat.st_nlink != 1:
+        return False
+
+    # A new file has to get the same owner and group
+    if stat.st_uid != os.geteuid() or \
+            stat.st_gid not in (os.getegid(), *os.getgroups()):
+        return False
+
+    if hasattr(os, 'listxattr'):
+        try:
+            attributes = os.listxattr(path, follow_symlinks=False)
+        except OSError:
+            # The file system doesn't support extended attributes
+            attributes = []
+
+        # The SELinux context of a new file is set by the system
+        if any(name != 'security.selinux' for name in attributes):
+            return False
+
+    return True
+
+
+def _sync(fd: int) -> None:
+    """
+    Flush the data of a file to disk.
+
+    Uses ``fdatasync`` where available, which skips flushing metadata (like
+    the modification time) that isn't needed to read the data back.
+    """
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
+    else:  # pragma: no cover
+        os.fsync(fd)
+
+
+def _map_file(fd: int, size: int) -> mmap.mmap:
+    """
+    Memory map a file for reading it from start to end.
+
+    Where supported, the pages are read ahead (and huge pages are used for
+    large files) so parsing doesn't have to wait for page faults.
+    """
+    flags = mmap.MAP_SHARED | getattr(mmap, 'MAP_POPULATE', 0)
+    mapped = mmap.mmap(fd, 0, flags=flags, prot=mmap.PROT_READ)
+
+    advice = ['MADV_SEQUENTIAL', 'MADV_WILLNEED']
+    if size >= HUGE_PAGE_SIZE:
+        advice.append('MADV_HUGEPAGE')
+
+    for name in advice:
+        if hasattr(mmap, name):
+            try:
+                mapped.madvise(getattr(mmap, name))
+            except OSError:  # pragma: no cover
+                # This is only a hint, not all kernels support everything
+                pass
+
+    return mapped
+
+
+def _pwrite_all(fd: int, chunks: Sequence[bytes], offset: int) -> None:
+    """
+    Write chunks of bytes to a file at the given offset.
+
+    Uses vectored writes where available, so the chunks don't have to be
+    joined into one buffer first.
+    """
+    views = [memoryview(chunk) for chunk in chunks if chunk]
+    start = 0
+
+    while start < len(views):
+        if hasattr(os, 'pwritev'):
+            written = os.pwritev(fd, views[start:start + IOV_MAX], offset)
+        else:  # pragma: no cover
+            written = os.pwrite(fd, views[start], offset)
+        offset += written
+
+        # Skip everything that has been written
+        while start < len(views) and written >= len(views[start]):
+            written -= len(views[start])
+            start += 1
+        if written:
+            views[start] = views[start][written:]
+
+
+def _allocate(fd: int, size: int) -> None:
+    """
+    Allocate disk space for the first ``size`` bytes of a file.
+
+    Raises an ``OSError`` if there isn't enough space left. Does nothing if
+    the platform or file system doesn't support preallocation.
+    """
+    if not hasattr(os, 'posix_fallocate'):  # pragma: no cover
+        return
+
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+
+
+def _signature(stat: os.stat_result) -> Tuple[int, int, int]:
+    """
+    Get the inode, size and modification time from a file's stats.
+    """
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _binary_mode(mode: str) -> str:
+    """
+    Get the binary variant of a file access mode (e.g. ``r+`` -> ``rb+``).
+    """
+    mode = mode.replace('t', '')
+    if 'b' in mode:
+        return mode
+
+    return mode[:1] + 'b' + mode[1:]
+
+
+def _orjson_option(kwargs: Dict[str, Any]) -> Optional[int]:
+    """
+    Translate ``json.dumps`` keyword arguments to ``orjson`` option flags.
+
+    Returns ``None`` if orjson is not available or the arguments cannot be
+    expressed with orjson (in which case the stdlib encoder has to be used).
+    """
+    if orjson is None:
+        return None
+
+    # json.dumps converts non-string keys (e.g. ints) to strings
+    option = orjson.OPT_NON_STR_KEYS
+
+    for key, value in kwargs.items():
+        if key == 'sort_keys':
+            if value:
+                option |= orjson.OPT_SORT_KEYS
+        elif key == 'indent' and value in (None, 2):
+            if value:
+                option |= orjson.OPT_INDENT_2
+        else:
+            return None
+
+    return option
+
+
+class _FileLock:
+    """
+    A lock that's shared between processes, using ``flock()`` on a lock file.
+
+    flock() locks belong to the open file description which is shared with
+    forked child processes. Thus every process opens the lock file on its own,
+    otherwise parent and child wouldn't exclude each other.
+
+    Waiting for an exclusive lock held by another instance in the same thread
+    would never end, so that raises a ``RuntimeError`` instead.
+    """
+    __slots__ = ('path', 'mode', '_key', '_fd', '_pid')
+
+    # The exclusive locks held in this process: the thread and the instance
+    # holding the lock for every lock file
+    _holders: Dict[str, Tuple[int, int, '_FileLock']] = {}
+
+    def __init__(self, path: str, mode: int = 0o666):
+        """
+        Create a new instance. The lock file is only opened when acquiring
+        the lock for the first time.
+
+        :param path: The lock file, created if it doesn't exist.
+        :param mode: The permissions of the lock file if it's created.
+        """
+        self.path = path
+        self.mode = mode
+        self._key = os.path.realpath(path)
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    def acquire(self, shared=False, blocking=True) -> bool:
+        """
+        Acquire the lock.
+
+        :param shared: Whether to acquire a shared lock, which only excludes
+                       exclusive locks, instead of an exclusive one.
+        :param blocking: Whether to wait until the lock is available.
+        :return: Whether the lock has been acquired (always if blocking).
+        """
+        if self._fd is None or self._pid != os.getpid():
+            self.close()
+
+            # Never truncate or follow a symlink, the lock file may be in a
+            # directory that's writable for other users
+            flags = os.O_CREAT | os.O_RDWR | getattr(os, 'O_NOFOLLOW', 0)
+            self._fd = os.open(self.path, flags, self.mode)
+            self._pid = os.getpid()
+
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        elif self._held_by_other_instance():
+            raise RuntimeError(f'{self.path} is locked by another instance '
+                               f'in this thread, e.g. in a transaction')
+
+        try:
+            fcntl.flock(self._fd, operation)
+        except BlockingIOError:
+            return False
+
+        if not shared:
+            self._holders[self._key] = (os.getpid(), threading.get_ident(),
+                                        self)
+
+        return True
+
+    def _held_by_other_instance(self) -> bool:
+        """
+        Check whether another instance in this thread holds the lock.
+        """
+        holder = self._holders.get(self._key)
+
+        return holder is not None and holder[2] is not self and \
+            holder[:2] == (os.getpid(), threading.get_ident())
+
+    def _forget(self) -> None:
+        """Forget that this instance holds the exclusive lock."""
+        holder = self._holders.get(self._key)
+        if holder is not None and holder[2] is self:
+            del self._holders[self._key]
+
+    def release(self) -> None:
+        """Release the lock."""
+        self._forget()
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        """Close the lock file."""
+        self._forget()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
 class Storage(ABC):
     """
     The abstract base class for all Storages with transaction support.
     A Storage (de)serializes the current state of the database and stores it in
     some place (memory, file on disk, ...).
     """
+    __slots__ = ('_in_transaction', '__weakref__')
+
     def __init__(self):
         self._in_transaction = False
 
@@ -128,130 +457,938 @@ class Storage(ABC):
 
 
 class JSONStorage(Storage):
-    """Store the data in a JSON file with proper transaction support."""
-    def __init__(self, path: str, create_dirs=False, encoding=None, access_mode='r+', **kwargs):
+    """
+    Store the data in a JSON file with proper transaction support.
+
+    Writes and transactions hold an exclusive lock on ``<path>.lock``, large
+    files are read while holding a shared lock (if possible). The lock file
+    is created when it's needed for the first time.
+    """
+    __slots__ = ('_mode', 'path', 'encoding', 'kwargs', '_lock', '_dirty',
+                 '_backup_linked', '_backup_path', '_replace_file',
+                 '_last_write',
+                 '_orjson_option', '_dumps', '_json_encoder', '_handle',
+                 '_inode')
+
+    def __init__(self, path: str, create_dirs=False, encoding=None, access_mode='r+', use_orjson=False,
+                 **kwargs):
+        """
+        Create a new instance.
+
+        Also creates the storage file, if it doesn't exist and the access mode
+        is appropriate for writing.
+
+        The file is always read and written as bytes. If orjson is used, the
+        encoding is only applied if the data can't be handled by orjson (which
+        always uses UTF-8).
+
+        :param path: Where to store the JSON data.
+        :param create_dirs: Whether to create all missing parent directories.
+        :param encoding: The encoding of the JSON file (default: UTF-8).
+        :param access_mode: mode in which the file is opened (r, r+)
+        :type access_mode: str
+        :param use_orjson: Whether to (de)serialize the data using orjson
+                           where possible. Note that orjson writes ``NaN``
+                           and infinite floats as ``null``.
+        """
+        if use_orjson and orjson is None:
+            raise ImportError('use_orjson requires the orjson package')
+
         super().__init__()
         self._mode = access_mode
         self.path = path
         self.encoding = encoding or 'utf-8'  # Make sure we have an encoding
         self.kwargs = kwargs
-        self._lock_file = None
+        self._lock = _FileLock(f"{path}.lock")
+        self._dirty = False
+        self._backup_linked = False
+        self._replace_file = False
+        self._last_write: Optional[Tuple[bytes, Tuple[int, int, int]]] = None
         if any([character in self._mode for character in ('+', 'w', 'a')]):
             touch(path, create_dirs=create_dirs)
-            
-        self._handle = open(path, mode=self._mode, encoding=self.encoding)
 
-    def _acquire_lock(self):
-        """Acquire an exclusive lock on the database file"""
-        if not self._lock_file:
-            lock_path = f"{self.path}.lock"
-            self._lock_file = open(lock_path, 'w')
-        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        # orjson always produces/expects UTF-8, other encodings (and options
+        # orjson doesn't support) go through the stdlib json module
+        self._orjson_option = None
+        if use_orjson and codecs.lookup(self.encoding).name == 'utf-8':
+            self._orjson_option = _orjson_option(kwargs)
 
-    def _release_lock(self):
-        """Release the exclusive lock on the database file"""
-        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        # Set up the encoder once instead of passing the options on every write
+        options = dict(kwargs)
+        encoder_cls = options.pop('cls', None) or json.JSONEncoder
+        self._json_encoder = encoder_cls(**options)
+
+        self._dumps: Callable[[Any], bytes]
+        if self._orjson_option is not None:
+            self._dumps = self._dumps_orjson
+        else:
+            self._dumps = self._dumps_json
+
+        self._open()
+
+    def _open(self) -> None:
+        """Open the database file."""
+        self._handle = open(self.path, mode=_binary_mode(self._mode))
+        self._inode = os.fstat(self._handle.fileno()).st_ino
+
+    def _stat(self) -> os.stat_result:
+        """
+        Get the stats of the database file.
+
+        Reopens the database file first if it has been replaced by a new file,
+        e.g. by a transaction in another process (see `_replace_contents`).
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return os.fstat(self._handle.fileno())
+
+        if stat.st_ino != self._inode:
+            self._handle.close()
+            self._open()
+
+        return stat
 
     def _begin_transaction(self) -> None:
         """Implementation of transaction start for JSON storage."""
         self._backup_path = f"{self.path}.backup"
-        self._acquire_lock()
-        # Create backup file - using same encoding as main file
-        with open(self.path, 'r', encoding=self.encoding) as source:
-            content = source.read()
-            with open(self._backup_path, 'w', encoding=self.encoding) as target:
-                target.write(content)
+        self._lock.acquire()
+
+        # Remove a leftover backup, a hardlink can't replace an existing file
+        if os.path.exists(self._backup_path):
+            os.remove(self._backup_path)
+
+        # Create backup file. If it's a hardlink, the first write has to
+        # move the database to a new file (see `_replace_contents`). That's
+        # only done if the database file can be replaced without changing
+        # anything but its contents, otherwise the backup is a copy which is
+        # written back in place on rollback.
+        self._replace_file = _is_replaceable(self.path)
+        self._backup_linked = _clone_file(self.path, self._backup_path,
+                                          link=self._replace_file)
+
+    def _replace_contents(self, content: Sequence[bytes]) -> None:
+        """
+        Write the content to a new file that replaces the database file, so
+        the backup (a hardlink to the old database file) isn't modified.
+        """
+        stat = os.stat(self.path)
+        new_path = f"{self.path}.new"
+
+        fd = os.open(new_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.fchmod(fd, stat.st_mode & 0o7777)
+            if os.fstat(fd).st_gid != stat.st_gid:
+                os.fchown(fd, -1, stat.st_gid)
+
+            _allocate(fd, sum(len(chunk) for chunk in content))
+            _pwrite_all(fd, content, 0)
+            _sync(fd)
+        finally:
+            os.close(fd)
+
+        # Replace the file atomically so other processes only ever see the old
+        # or the new contents
+        os.replace(new_path, self.path)
+
+        self._handle.close()
+        self._open()
+        self._backup_linked = False
 
     def _commit_transaction(self) -> None:
         """Implementation of transaction commit for JSON storage."""
-        self._handle.flush()
-        os.fsync(self._handle.fileno())
+        # Sync all writes of this transaction at once
+        if self._dirty:
+            _sync(self._handle.fileno())
+            self._dirty = False
+
+        self._backup_linked = False
+
         # Remove backup after successful commit
         if os.path.exists(self._backup_path):
             os.remove(self._backup_path)
-        self._release_lock()
+        self._lock.release()
 
     def _rollback_transaction(self) -> None:
         """Implementation of transaction rollback for JSON storage."""
+        written, self._dirty = self._dirty, False
+        self._last_write = None
         try:
-            # Close current handle
-            self._handle.close()
-            
-            # Restore from backup
-            with open(self._backup_path, 'r', encoding=self.encoding) as backup:
-                content = backup.read()
-            
-            # Write backup content to main file
-            with open(self.path, 'w', encoding=self.encoding) as main:
-                main.write(content)
-            
-            # Reopen the handle
-            self._handle = open(self.path, mode=self._mode, encoding=self.encoding)
-            
+            # If the backup is still a hardlink to the database file, nothing
+            # has been written and the backup only has to be removed.
+            # Otherwise the backup replaces the database file or, if that's
+            # not possible, its contents are written back.
+            if self._backup_linked:
+                pass
+            elif self._replace_file:
+                self._handle.close()
+                os.replace(self._backup_path, self.path)
+                self._open()
+            elif written:
+                with open(self._backup_path, 'rb') as backup:
+                    content = backup.read()
+                self._write_contents([content], 0, self._stat().st_size)
+                _sync(self._handle.fileno())
+                self._dirty = False
         finally:
+            self._backup_linked = False
+
             # Clean up backup
             if os.path.exists(self._backup_path):
                 os.remove(self._backup_path)
-            self._release_lock()
+            self._lock.release()
 
 
     def close(self) -> None:
-        """Close the file handle."""
+        """Close the file handles."""
         self._handle.close()
+        self._lock.close()
 
     def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
         # Get the file size
-        self._handle.seek(0, os.SEEK_END)
-        size = self._handle.tell()
+        size = self._stat().st_size
 
         if not size:
             return None
-        
-        # Return to start and read
-        self._handle.seek(0)
-        return json.load(self._handle)
 
-    def write(self, data: Dict[str, Dict[str, Any]]) -> None:
-        # Move to start
-        self._handle.seek(0)
+        return self._read_contents(size, self._loads)
+
+    def _read_contents(self, size: int, parse: Callable[[Any], T]) -> T:
+        """
+        Read the contents of the database file.
+
+        :param size: The size of the database file.
+        :param parse: Called with the contents as a bytes-like object.
+        :return: The result of ``parse``.
+        """
+        fd = self._handle.fileno()
+
+        # Large files are parsed straight from a memory map which saves
+        # copying the whole file into a bytes object first. Accessing mapped
+        # pages after the file has been truncated kills the process (SIGBUS),
+        # so the file is only mapped while holding the lock, which is needed
+        # for writing to it (see `_write_lock`).
+        if size >= MMAP_THRESHOLD:
+            with self._read_lock() as locked:
+                # The file may have been truncated before getting the lock
+                if locked and os.fstat(fd).st_size:
+                    with _map_file(fd, size) as mapped, \
+                            memoryview(mapped) as view:
+                        return parse(view)
+
+        # Read the whole file in one go without touching the file position
+        return parse(os.pread(fd, size, 0))
+
+    @contextmanager
+    def _read_lock(self):
+        """
+        Hold a shared lock on the database file, unless we're holding the
+        exclusive lock of a transaction already.
+
+        Doesn't wait for the lock, yields whether it has been acquired.
+        """
+        if self._in_transaction:
+            yield True
+            return
 
-        # Write the serialized data
-        serialized = json.dumps(data, **self.kwargs)
-        
         try:
-            self._handle.write(serialized)
-        except io.UnsupportedOperation:
+            locked = self._lock.acquire(shared=True, blocking=False)
+        except OSError:
+            # E.g. the lock file can't be created in a read-only directory
+            locked = False
+
+        try:
+            yield locked
+        finally:
+            if locked:
+                self._lock.release()
+
+    def _loads(self, content) -> Any:
+        """Deserialize the raw file contents."""
+        if self._orjson_option is not None:
+            try:
+                return orjson.loads(content)
+            except orjson.JSONDecodeError:
+                # orjson is stricter than the json module, e.g. it doesn't
+                # accept NaN and Infinity
+                pass
+
+        return json.loads(str(content, self.encoding))
+
+    def _dumps_orjson(self, data: Dict[str, Dict[str, Any]]) -> bytes:
+        """Serialize the data using orjson."""
+        try:
+            return orjson.dumps(data, option=self._orjson_option)
+        except orjson.JSONEncodeError:
+            # E.g. integers that don't fit in 64 bits or custom types
+            return self._dumps_json(data)
+
+    def _dumps_json(self, data: Dict[str, Dict[str, Any]]) -> bytes:
+        """Serialize the data using the stdlib json module."""
+        return self._json_encoder.encode(data).encode(self.encoding)
+
+    def write(self, data: Dict[str, Dict[str, Any]]) -> None:
+        # Serialize the data
+        serialized = self._dumps(data)
+        digest = hashlib.blake2b(serialized, digest_size=16).digest()
+
+        with self._write_lock():
+            # Skip writing if the file still contains exactly this data. The
+            # file stats guard against modifications made by someone else.
+            stat = self._stat()
+            if (digest, _signature(stat)) == self._last_write:
+                return
+
+            size = self._prepare_write(stat.st_size)
+            self._write_contents([serialized], 0, size)
+
+            self._last_write = (digest,
+                                _signature(os.fstat(self._handle.fileno())))
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        Hold the exclusive lock on the database file while writing, unless
+        we're holding it for a transaction already.
+
+        Writes thus wait for transactions of other processes, and readers can
+        rely on the file not being truncated while they hold the lock (see
+        `_read_contents`).
+        """
+        if not self._handle.writable():
             raise IOError(f'Cannot write to the database. Access mode is "{self._mode}"')
 
-        # Ensure written to disk
-        self._handle.flush()
-        os.fsync(self._handle.fileno())
+        if self._in_transaction:
+            yield
+            return
+
+        self._lock.acquire()
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    def _prepare_write(self, size: int) -> int:
+        """
+        Get the size of the database file to write to.
+
+        :param size: The current size of the database file.
+        """
+        # The first write after backing up the database as a hardlink goes
+        # to a new file (see `_write_contents`)
+        if self._backup_linked:
+            return 0
+
+        return size
+
+    def _write_contents(self, content: Sequence[bytes], offset: int,
+                        size: int) -> None:
+        """
+        Write to the database file, dropping everything after the new content.
+
+        :param content: The chunks of bytes to write.
+        :param offset: Where to write the content to.
+        :param size: The current size of the database file.
+        """
+        if self._backup_linked:
+            # Only complete contents can go to a new file
+            assert offset == 0
+            self._replace_contents(content)
+            return
+
+        fd = self._handle.fileno()
+        end = offset + sum(len(chunk) for chunk in content)
+
+        # The file is overwritten in place, so make sure there is enough space
+        # before touching it. Running out of space halfway would leave a
+        # corrupted database behind.
+        if end > size:
+            _allocate(fd, end)
+
+        # Write the content using positional writes which don't depend on
+        # (or change) the file position
+        _pwrite_all(fd, content, offset)
 
         # Truncate any remaining data
-        self._handle.truncate()
+        if end < size:
+            os.ftruncate(fd, end)
+
+        # Ensure written to disk. Inside a transaction this is deferred until
+        # the transaction is committed.
+        if self._in_transaction:
+            self._dirty = True
+        else:
+            _sync(fd)
+
+
+class NDJSONStorage(JSONStorage):
+    """
+    Store the data as a log of changes in a newline-delimited JSON file.
+
+    Every line of the file is one log entry. Writing only appends entries for
+    the tables and documents that have changed since the last write instead
+    of rewriting the whole database. Once the log contains more than twice as
+    many entries as needed to describe the current data, it is compacted.
+    """
+    __slots__ = ('_state', '_state_signature', '_entries')
+
+    def __init__(self, path: str, create_dirs=False, encoding=None, access_mode='r+', use_orjson=False,
+                 **kwargs):
+        """
+        Create a new instance.
+
+        :param path: Where to store the log.
+        :param create_dirs: Whether to create all missing parent directories.
+        :param encoding: The encoding of the log file (default: UTF-8).
+        :param access_mode: mode in which the file is opened (r, r+)
+        :type access_mode: str
+        :param use_orjson: Whether to (de)serialize the data using orjson
+                           where possible (see :class:`JSONStorage`).
+        """
+        if kwargs.get('indent') is not None:
+            raise ValueError('NDJSONStorage does not support indentation')
+
+        if '\n'.encode(encoding or 'utf-8') != b'\n':
+            raise ValueError(f'NDJSONStorage does not support the encoding '
+                             f'"{encoding}"')
+
+        super().__init__(path, create_dirs=create_dirs, encoding=encoding,
+                         access_mode=access_mode, use_orjson=use_orjson,
+                         **kwargs)
+
+        # The serialized documents in the log file (if it hasn't been modified
+        # since), used to find out what has changed on the next write
+        self._state: Optional[Dict[str, Dict[str, bytes]]] = None
+        self._state_signature: Optional[Tuple[int, int, int]] = None
+        self._entries = 0
+
+    def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        stat = self._stat()
+
+        if not stat.st_size:
+            return None
+
+        tables, entries, complete = self._read_contents(stat.st_size,
+                                                        self._replay)
+
+        # If the file has been changed by someone else, the new contents
+        # become the base for the next write. If the last entry is
+        # incomplete (e.g. a write has been interrupted), the next write
+        # compacts the log instead, which removes the incomplete entry.
+        if _signature(stat) != self._state_signature:
+            self._state = self._serialize(tables) if complete else None
+            self._state_signature = _signature(stat)
+            self._entries = entries
+
+        return tables
+
+    def _replay(self, content) \
+            -> Tuple[Dict[str, Dict[str, Any]], int, bool]:
+        """
+        Replay the log entries.
+
+        Entries are parsed straight from the content (which may be a memory
+        map) without copying it. An incomplete last entry is skipped.
+
+        :return: The resulting data, the number of log entries and whether
+                 the last entry is complete.
+        """
+        tables: Dict[str, Dict[str, Any]] = {}
+        entries = 0
+
+        with memoryview(content) as view:
+            for match in NDJSON_LINE.finditer(view):
+                with view[match.start():match.end()] as line:
+                    entry = self._loads(line)
+                entries += 1
+
+                op, table = entry['op'], entry['table']
+                if op == 'table':
+                    tables.setdefault(table, {})
+                elif op == 'drop':
+                    tables.pop(table, None)
+                elif op == 'upsert':
+                    tables.setdefault(table, {})[entry['id']] = entry['doc']
+                elif op == 'delete':
+                    tables.get(table, {}).pop(entry['id'], None)
+                else:
+                    raise ValueError(f'Unknown log entry: {op}')
+
+            complete = view[-1:] == b'\n'
+
+        return tables, entries, complete
+
+    def _serialize(self, data: Dict[str, Dict[str, Any]]) \
+            -> Dict[str, Dict[str, bytes]]:
+        """Serialize all documents."""
+        return {
+            table: {str(doc_id): self._dumps(doc) for doc_id, doc in docs.items()}
+            for table, docs in data.items()
+        }
+
+    def _entry(self, op: str, table: str, **fields) -> bytes:
+        """Serialize a log entry."""
+        return self._dumps({'op': op, 'table': table, **fields}) + b'\n'
+
+    def _diff(self, old_state: Dict[str, Dict[str, bytes]],
+              data: Dict[str, Dict[str, Any]],
+              state: Dict[str, Dict[str, bytes]]) -> List[bytes]:
+        """
+        Get the log entries that turn the old state into the new one.
+        """
+        entries = []
+
+        for table in old_state.keys() - state.keys():
+            entries.append(self._entry('drop', table))
+
+        for table, docs in state.items():
+            try:
+                old_docs = old_state[table]
+            except KeyError:
+                old_docs = {}
+                entries.append(self._entry('table', table))
+
+            for doc_id in old_docs.keys() - docs.keys():
+                entries.append(self._entry('delete', table, id=doc_id))
+
+            for doc_id, doc in data[table].items():
+                doc_id = str(doc_id)
+                if old_docs.get(doc_id) != docs[doc_id]:
+                    entries.append(self._entry('upsert', table, id=doc_id,
+                                               doc=doc))
+
+        return entries
+
+    def _snapshot(self, data: Dict[str, Dict[str, Any]]) -> List[bytes]:
+        """
+        Get the log entries to create the given data from scratch.
+        """
+        entries = []
+
+        for table, docs in data.items():
+            entries.append(self._entry('table', table))
+            for doc_id, doc in docs.items():
+                entries.append(self._entry('upsert', table, id=str(doc_id),
+                                           doc=doc))
+
+        return entries
+
+    def write(self, data: Dict[str, Dict[str, Any]]) -> None:
+        state = self._serialize(data)
+
+        with self._write_lock():
+            self._append(data, state)
+
+    def _append(self, data: Dict[str, Dict[str, Any]],
+                state: Dict[str, Dict[str, bytes]]) -> None:
+        """
+        Append the changes to the log, or compact it.
+
+        :param data: The data to write.
+        :param state: The serialized documents of the data.
+        """
+        stat = self._stat()
+
+        # Only append the changes if we know what the file contains
+        if (self._state is not None and not self._backup_linked and
+                _signature(stat) == self._state_signature):
+            entries = self._diff(self._state, data, state)
+            if not entries:
+                return
+
+            total = self._entries + len(entries)
+        else:
+            entries = []
+            total = 0
+
+        # Compact the log if the entries describing the current data (one for
+        # every table and document) are less than half of the log
+        compact_size = len(state) + sum(len(docs) for docs in state.values())
+        if not total or total > 2 * compact_size:
+            entries = self._snapshot(data)
+            total = len(entries)
+            offset = 0
+        else:
+            offset = stat.st_size
+
+        size = self._prepare_write(stat.st_size)
+        self._write_contents(entries, offset, size)
+
+        self._state = state
+        self._state_signature = _signature(os.fstat(self._handle.fileno()))
+        self._entries = total
+
+
+class _TransactionTables(dict):
+    """
+    The tables of a :class:`MemoryStorage` during a transaction.
+
+    Tables update their documents in place, so each of the tables that existed
+    when the transaction began is backed up (deep copied) the first time it is
+    accessed. Tables that are never accessed don't have to be copied at all.
+    """
+    __slots__ = ('_original', '_backups')
+
+    def __init__(self, tables: Dict[str, Dict[str, Any]],
+                 original: Dict[str, Dict[str, Any]],
+                 backups: Dict[str, Dict[str, Any]]):
+        super().__init__(tables)
+        self._original = original
+        self._backups = backups
+
+    def _backup(self, name) -> None:
+        """Back up a table before handing it out."""
+        if name in self._backups or name not in self._original:
+            return
+
+        # Only the original table needs a backup, not a replacement
+        table = dict.get(self, name)
+        if table is self._original[name]:
+            self._backups[name] = copy.deepcopy(table)
+
+    def _backup_all(self) -> None:
+        """Back up all tables."""
+        for name in self:
+            self._backup(name)
+
+    def __getitem__(self, name):
+        self._backup(name)
+        return super().__getitem__(name)
+
+    def __iter__(self):
+        # Iterating the names doesn't need a backup. But overriding this makes
+        # the C-level copies (dict(tables), {**tables}, tables | other, ...)
+        # get the tables using __getitem__ instead of skipping the backups.
+        return super().__iter__()
+
+    def get(self, name, default=None):
+        self._backup(name)
+        return super().get(name, default)
+
+    def setdefault(self, name, default=None):
+        self._backup(name)
+        return super().setdefault(name, default)
+
+    def pop(self, name, *args):
+        self._backup(name)
+        return super().pop(name, *args)
+
+    def popitem(self):
+        self._backup_all()
+        return super().popitem()
+
+    def values(self):
+        self._backup_all()
+        return super().values()
+
+    def items(self):
+        self._backup_all()
+        return super().items()
+
+    def copy(self):
+        self._backup_all()
+        return super().copy()
+
 
 class MemoryStorage(Storage):
     """Store the data in memory with transaction support."""
+    __slots__ = ('memory', '_backup', '_table_backups')
+
     def __init__(self):
         super().__init__()
         self.memory = None
         self._backup = None
+        self._table_backups = {}
 
     def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
         return self.memory
 
     def write(self, data: Dict[str, Dict[str, Any]]):
+        # Keep tables that are handed out during a transaction backed up
+        if (self._in_transaction and self._backup is not None and
+                not isinstance(data, _TransactionTables)):
+            data = _TransactionTables(data, self._backup, self._table_backups)
+
         self.memory = data
 
     def _begin_transaction(self) -> None:
         """Implementation of transaction start for memory storage."""
-        self._backup = json.loads(json.dumps(self.memory)) if self.memory is not None else None
+        # The top-level dict is replaced for the transaction, so the original
+        # one stays as it is. The tables are backed up once they're accessed.
+        self._backup = self.memory
+        self._table_backups = {}
+        if self.memory is not None:
+            self.memory = _TransactionTables(self.memory, self.memory,
+                                             self._table_backups)
 
     def _commit_transaction(self) -> None:
         """Implementation of transaction commit for memory storage."""
+        if isinstance(self.memory, _TransactionTables):
+            self.memory = dict(self.memory)
         self._backup = None
+        self._table_backups = {}
 
     def _rollback_transaction(self) -> None:
         """Implementation of transaction rollback for memory storage."""
-        self.memory = self._backup
-        self._backup = None
\ No newline at end of file
+        if self._backup is None:
+            self.memory = None
+        else:
+            self.memory = {
+                name: self._table_backups.get(name, table)
+                for name, table in self._backup.items()
+            }
+        self._backup = None
+        self._table_backups = {}
+
+
+def _shared_memory(name: str, create=False, size=0) -> SharedMemory:
+    """
+    Attach to (or create) a shared memory block that outlives this process.
+
+    By default Python unlinks shared memory blocks when the process that
+    created or attached to them exits, which would take the data away from
+    all other processes.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, create, size, track=False)  # type: ignore
+
+    shm = SharedMemory(name, create, size)
+    resource_tracker.unregister(shm._name, 'shared_memory')  # type: ignore
+    return shm
+
+
+def _buffer(shm: SharedMemory) -> memoryview:
+    """
+    Get the memory of a shared memory block.
+    """
+    if shm.buf is None:
+        raise ValueError('Shared memory block has been closed')
+
+    return shm.buf
+
+
+def _unlink_shared_memory(shm: SharedMemory) -> None:
+    """
+    Remove a shared memory block attached with :func:`_shared_memory`.
+    """
+    if sys.version_info < (3, 13):
+        # unlink() removes the block from the resource tracker again
+        resource_tracker.register(shm._name, 'shared_memory')  # type: ignore
+
+    shm.unlink()
+
+
+class SharedMemoryStorage(Storage):
+    """
+    Store the data in shared memory, so multiple processes can use the same
+    database without a file.
+
+    The data is pickled into a shared memory block that's never modified
+    again. Every write creates a new block and publishes its version number
+    in a small header block that's named after the database. Readers only
+    unpickle the data again if the version has changed.
+
+    As pickle can execute arbitrary code, the data must only be shared with
+    trusted processes (shared memory blocks are only accessible to the user
+    who created them by default).
+    """
+    __slots__ = ('name', '_lock', '_version', '_data', '_backup', '_header')
+
+    #: Layout of the header block: the current version
+    HEADER = struct.Struct('<Q')
+
+    #: Layout of a data block: the length and BLAKE2b digest of the data
+    DATA_HEADER = struct.Struct('<Q16s')
+
+    def __init__(self, name: str):
+        """
+        Create a new instance.
+
+        Attaches to the database if it exists already.
+
+        :param name: The name of the database. May only contain ASCII
+                     letters, digits, ``_``, ``-`` and ``.``.
+        """
+        super().__init__()
+
+        # The name is used for shared memory blocks and the lock file
+        if not re.fullmatch(r'[A-Za-z0-9_.-]+', name):
+            raise ValueError(f'Invalid database name: {name!r}')
+
+        self.name = name
+        self._lock = _FileLock(os.path.join(tempfile.gettempdir(),
+                                            f'tinydb-{name}.lock'), 0o600)
+        self._version = 0
+        self._data: Optional[Dict[str, Dict[str, Any]]] = None
+        self._backup: Optional[Dict[str, Dict[str, Any]]] = None
+
+        while True:
+            try:
+                self._header = _shared_memory(name)
+                break
+            except FileNotFoundError:
+                pass
+
+            try:
+                self._header = _shared_memory(name, create=True,
+                                              size=self.HEADER.size)
+                break
+            except FileExistsError:
+                pass
+
+    def _block_name(self, version: int) -> str:
+        """Get the name of the data block for a version."""
+        # Database names can't contain "@", so a data block never has the
+        # name of another database's header block
+        return f'{self.name}@{version}'
+
+    def _current_version(self) -> int:
+        """Get the version that has been published last."""
+        return self.HEADER.unpack_from(_buffer(self._header))[0]
+
+    def _create_block(self, version: int, size: int) -> SharedMemory:
+        """
+        Create the data block for a new version. Requires holding the lock.
+        """
+        name = self._block_name(version)
+        while True:
+            try:
+                return _shared_memory(name, create=True, size=size)
+            except FileExistsError:
+                pass
+
+            # A writer died before publishing the block, so it's never
+            # going to be read and can be replaced
+            try:
+                stale = _shared_memory(name)
+            except FileNotFoundError:
+                continue
+            stale.close()
+            _unlink_shared_memory(stale)
+
+    def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        while True:
+            version = self._current_version()
+            if version == self._version:
+                return self._data
+
+            try:
+                block = _shared_memory(self._block_name(version))
+            except FileNotFoundError:
+                # New versions are published before removing the old data,
+                # so the version only stays the same if the database is gone
+                if self._current_version() == version:
+                    raise
+                continue
+
+            try:
+                buf = _buffer(block)
+                length, digest = self.DATA_HEADER.unpack_from(buf)
+                start = self.DATA_HEADER.size
+
+                # Unpickle straight from the shared memory
+                with buf[start:start + length] as payload:
+                    # Blocks are complete once published, so a mismatch
+                    # means the data has been corrupted
+                    if hashlib.blake2b(payload, digest_size=16).digest() \
+                            != digest:
+                        raise ValueError(
+                            f'Data of database {self.name!r} is corrupted'
+                        )
+
+                    data = pickle.loads(payload)
+            finally:
+                block.close()
+
+            self._data = data
+            self._version = version
+
+            return data
+
+    def write(self, data: Dict[str, Dict[str, Any]]) -> None:
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+
+        # Inside a transaction we're holding the lock already
+        if not self._in_transaction:
+            self._lock.acquire()
+
+        try:
+            old_version = self._current_version()
+            version = old_version + 1
+
+            block = self._create_block(version,
+                                       self.DATA_HEADER.size + len(payload))
+            try:
+                buf = _buffer(block)
+                self.DATA_HEADER.pack_into(buf, 0, len(payload), digest)
+
+                # The block may be larger than requested (rounded up to
+                # whole pages on some platforms)
+                start = self.DATA_HEADER.size
+                buf[start:start + len(payload)] = payload
+            finally:
+                block.close()
+
+            # Publish the new version
+            self.HEADER.pack_into(_buffer(self._header), 0, version)
+
+            # Remove the old data. Processes which are reading it right now
+            # keep it mapped until they are done.
+            if old_version:
+                try:
+                    old_block = _shared_memory(self._block_name(old_version))
+                except FileNotFoundError:
+                    pass
+                else:
+                    old_block.close()
+                    _unlink_shared_memory(old_block)
+        finally:
+            if not self._in_transaction:
+                self._lock.release()
+
+        self._data = data
+        self._version = version
+
+    def close(self) -> None:
+        """Detach from the shared memory."""
+        self._header.close()
+        self._lock.close()
+
+    def unlink(self) -> None:
+        """
+        Delete the database from shared memory.
+
+        Other processes using the database must not access it afterwards.
+        """
+        version = self._current_version()
+        if version:
+            try:
+                block = _shared_memory(self._block_name(version))
+            except FileNotFoundError:
+                pass
+            else:
+                block.close()
+                _unlink_shared_memory(block)
+
+        _unlink_shared_memory(self._header)
+
+    def _begin_transaction(self) -> None:
+        """Implementation of transaction start for shared memory storage."""
+        self._lock.acquire()
+        self._backup = copy.deepcopy(self.read())
+
+    def _commit_transaction(self) -> None:
+        """Implementation of transaction commit for shared memory storage."""
+        self._backup = None
+        self._lock.release()
+
+    def _rollback_transaction(self) -> None:
+        """Implementation of transaction rollback for shared memory storage."""
+        try:
+            if self._version != self._current_version() or \
+                    self._data != self._backup:
+                self.write(self._backup or {})
+        finally:
+            self._backup = None
+            self._lock.release()